@@ -0,0 +1,158 @@
+"""
+bootstrap.py
+
+This file contains functions for computing bootstrap confidence intervals of group means.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+
+def _get_group_distributions(
+    df: pd.DataFrame, group_column: str, value_column: str
+) -> list:
+    """Returns, for each group, the distinct values of the column and their frequencies
+
+    Resampling n rows with replacement is the same as drawing multinomial counts
+    over the distinct values weighted by their frequencies, which is much cheaper
+    as scores and ABV only take a few hundred distinct values (see _resample_means
+    for columns with many distinct values).
+
+    Args:
+        df (pd.DataFrame): dataframe of the reviews
+        group_column (str): column defining the groups (e.g. "climate")
+        value_column (str): column of which the mean is computed (e.g. "overall")
+
+    Returns:
+        list: one (group, values, probabilities, n) tuple per group, sorted by group
+    """
+    counts = (
+        df[[group_column, value_column]]
+        .dropna()
+        .groupby([group_column, value_column], observed=True)
+        .size()
+    )
+
+    distributions = []
+    for group, group_counts in counts.groupby(level=0, sort=True):
+        n = group_counts.sum()
+        distributions.append(
+            (
+                group,
+                group_counts.index.get_level_values(1).to_numpy(dtype=float),
+                group_counts.to_numpy() / n,
+                n,
+            )
+        )
+    return distributions
+
+
+def _resample_means(distributions: list, n_resamples: int, seed) -> np.ndarray:
+    """Returns the means of n_resamples bootstrap resamples of each group
+
+    Args:
+        distributions (list): output of _get_group_distributions
+        n_resamples (int): number of resamples to draw
+        seed (np.random.SeedSequence): seed of the random generator
+
+    Returns:
+        np.ndarray: (n_resamples, n_groups) array of the resampled means
+    """
+    rng = np.random.default_rng(seed)
+
+    means = []
+    for _, values, probabilities, n in distributions:
+        if len(values) * 10 > n:
+            # Nearly continuous column (e.g. debiased scores): a multinomial over about n
+            # values is much slower than drawing the n rows of each resample
+            rows = np.repeat(values, np.rint(probabilities * n).astype(int))
+            means.append(
+                [rows[rng.integers(0, n, n)].mean() for _ in range(n_resamples)]
+            )
+        else:
+            means.append(
+                rng.multinomial(n, probabilities, size=n_resamples) @ values / n
+            )
+    return np.stack(means, axis=1)
+
+
+def bootstrap_group_means(
+    df: pd.DataFrame,
+    group_column: str,
+    value_columns,
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = None,
+    n_jobs: int = 1,
+    chunk_size: int = 100,
+) -> pd.DataFrame:
+    """Returns the mean of each group with its bootstrap confidence interval
+
+    The resamples are drawn in chunks of chunk_size, each (column, chunk) having its
+    own seed spawned from `seed`, so that the columns are resampled independently and
+    the results do not depend on n_jobs.
+
+    The result can be plotted directly:
+    - maps: `plot_climate_one_stat(ci_df.xs("overall", level="column").reset_index(), "mean", ...)`
+    - spider charts: `spider_plot(scores, ci_df["mean"].to_dict(), climates)`
+
+    Args:
+        df (pd.DataFrame): dataframe of the reviews
+        group_column (str): column defining the groups (e.g. "climate")
+        value_columns (str or list): column(s) of which the mean is computed (e.g. "overall")
+        n_resamples (int, optional): number of bootstrap resamples. Defaults to 1000.
+        confidence (float, optional): confidence level of the intervals. Defaults to 0.95.
+        seed (int, optional): seed of the random generator. Defaults to None.
+        n_jobs (int, optional): number of processes drawing the resamples. Defaults to 1 (no process pool).
+        chunk_size (int, optional): number of resamples drawn at once. Defaults to 100.
+
+    Returns:
+        pd.DataFrame: dataframe indexed by (group_column, "column") with the columns
+        "count", "mean", "std_err", "ci_low" and "ci_high"
+    """
+    if isinstance(value_columns, str):
+        value_columns = [value_columns]
+
+    chunks = [
+        min(chunk_size, n_resamples - start)
+        for start in range(0, n_resamples, chunk_size)
+    ]
+
+    # One independent stream per (column, chunk)
+    column_seeds = np.random.SeedSequence(seed).spawn(len(value_columns))
+
+    pool = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs != 1 else nullcontext()
+    with pool as executor:
+        mapper = map if executor is None else executor.map
+
+        results = []
+        for value_column, column_seed in zip(value_columns, column_seeds):
+            distributions = _get_group_distributions(df, group_column, value_column)
+            seeds = column_seed.spawn(len(chunks))
+            means = mapper(
+                _resample_means, [distributions] * len(chunks), chunks, seeds
+            )
+            means = np.concatenate(list(means), axis=0)
+
+            alpha = (1 - confidence) / 2
+            results.append(
+                pd.DataFrame(
+                    {
+                        group_column: [group for group, _, _, _ in distributions],
+                        "column": value_column,
+                        "count": [n for _, _, _, n in distributions],
+                        "mean": [
+                            values @ probabilities
+                            for _, values, probabilities, _ in distributions
+                        ],
+                        "std_err": means.std(axis=0, ddof=1),
+                        "ci_low": np.quantile(means, alpha, axis=0),
+                        "ci_high": np.quantile(means, 1 - alpha, axis=0),
+                    }
+                )
+            )
+
+    return pd.concat(results).set_index([group_column, "column"])
@@ -0,0 +1,314 @@
+"""
+matching.py
+
+This file contains functions for matching the breweries and the beers of BeerAdvocate and RateBeer.
+
+The tables of each website use the column names of get_breweries_df and get_beers_df,
+with the suffix "_ba" for BeerAdvocate and "_rb" for RateBeer. Instead of comparing all
+the pairs of names, which is quadratic, candidate pairs are generated with blocking
+indexes: only names from the same block (country, or state in the United States, for the
+breweries, matched brewery for the beers) sharing one of their rarest character trigrams
+are compared.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+
+# Words that do not help to tell breweries apart
+BREWERY_STOP_WORDS = {
+    "the",
+    "brewery",
+    "breweries",
+    "brewing",
+    "brewhouse",
+    "brauerei",
+    "brasserie",
+    "birrificio",
+    "cerveceria",
+    "company",
+    "co",
+    "ltd",
+    "llc",
+    "inc",
+    "and",
+}
+
+
+def normalize_name(name: str, stop_words: set = frozenset()) -> str:
+    """Returns the name in lower case, without accents, punctuation and stop words
+
+    Args:
+        name (str): name of a beer or of a brewery
+        stop_words (set, optional): words to remove from the name. Defaults to no word.
+
+    Returns:
+        str: normalized name
+    """
+    name = unicodedata.normalize("NFKD", str(name))
+    name = name.encode("ascii", "ignore").decode().lower()
+    words = re.findall(r"[a-z0-9]+", name)
+    return " ".join(word for word in words if word not in stop_words)
+
+
+def _get_trigrams(name: str) -> list:
+    """Returns the distinct character trigrams of a normalized name"""
+    padded = f"  {name} "
+    return list({padded[i : i + 3] for i in range(len(padded) - 2)})
+
+
+def _get_candidate_pairs(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    left_id: str,
+    right_id: str,
+    left_name: str,
+    right_name: str,
+    block: str,
+    min_sim: float,
+    stop_words: set = frozenset(),
+) -> pd.DataFrame:
+    """Returns the pairs of rows of the same block whose names may have a similarity of at
+    least min_sim, with the Jaccard similarity of their sets of trigrams
+
+    The candidates are generated with prefix filtering: the trigrams of each name are
+    ordered from the rarest to the most frequent, and two names can only reach a Jaccard
+    similarity of min_sim if they share one of the len - ceil(min_sim * len) + 1 rarest
+    trigrams of each name. Frequent trigrams (e.g. "ing") are therefore left out of the
+    inverted index without losing any pair above min_sim.
+
+    Args:
+        left (pd.DataFrame): table of the first website, with a column `block`
+        right (pd.DataFrame): table of the second website, with a column `block`
+        left_id (str): id column of the left table
+        right_id (str): id column of the right table
+        left_name (str): name column of the left table
+        right_name (str): name column of the right table
+        block (str): column of the blocking key, present in both tables
+        min_sim (float): minimum similarity of the pairs to find
+        stop_words (set, optional): words removed from the names. Defaults to no word.
+
+    Returns:
+        pd.DataFrame: candidate pairs with the columns left_id, right_id and "sim"
+    """
+
+    def index(df, id_column, name_column):
+        df = df.drop_duplicates(subset=id_column)
+        names = df[name_column].map(lambda name: normalize_name(name, stop_words))
+        grams = pd.DataFrame(
+            {
+                id_column: df[id_column].to_numpy(),
+                block: df[block].to_numpy(),
+                "gram": names.map(_get_trigrams).to_numpy(),
+            }
+        )
+        grams["n_grams"] = grams["gram"].map(len)
+        return grams.explode("gram").dropna(subset=["gram"])
+
+    left_grams = index(left, left_id, left_name)
+    right_grams = index(right, right_id, right_name)
+
+    # Global order of the trigrams, from the rarest to the most frequent
+    frequency = pd.concat([left_grams["gram"], right_grams["gram"]]).value_counts()
+    order = (
+        frequency.rename_axis("gram")
+        .reset_index()
+        .sort_values(["count", "gram"], kind="stable")
+    )
+    gram_rank = pd.Series(np.arange(len(order)), index=order["gram"])
+
+    def prefix(grams, id_column):
+        grams = grams.assign(rank=grams["gram"].map(gram_rank)).sort_values(
+            [id_column, "rank"], kind="stable"
+        )
+        position = grams.groupby(id_column, sort=False).cumcount().to_numpy()
+        n_grams = grams["n_grams"].to_numpy()
+        return grams[position < n_grams - np.ceil(min_sim * n_grams) + 1]
+
+    # Only the pairs of the same block sharing a prefix trigram are ever compared
+    pairs = (
+        prefix(left_grams, left_id)
+        .merge(prefix(right_grams, right_id), on=[block, "gram"])[[left_id, right_id]]
+        .drop_duplicates()
+    )
+
+    # Exact similarity of the candidates, on all their trigrams
+    shared = (
+        pairs.merge(left_grams[[left_id, "gram", "n_grams"]], on=left_id)
+        .merge(
+            right_grams[[right_id, "gram", "n_grams"]],
+            on=[right_id, "gram"],
+            suffixes=("_left", "_right"),
+        )
+        .groupby([left_id, right_id], sort=False)
+        .agg(
+            shared=("gram", "size"),
+            n_left=("n_grams_left", "first"),
+            n_right=("n_grams_right", "first"),
+        )
+        .reset_index()
+    )
+    shared["sim"] = shared["shared"] / (
+        shared["n_left"] + shared["n_right"] - shared["shared"]
+    )
+    return shared[[left_id, right_id, "sim"]]
+
+
+def _select_matches(
+    pairs: pd.DataFrame, left_id: str, right_id: str, min_sim: float
+) -> pd.DataFrame:
+    """Matches each row at most once, greedily from the most similar pair
+
+    A row whose best candidate is already matched falls back to its best free candidate.
+    "diff" is the margin between the similarity of the match and the one of the best other
+    candidate of the left row (the similarity itself if there is none), negative when the
+    row fell back.
+
+    Args:
+        pairs (pd.DataFrame): output of _get_candidate_pairs
+        left_id (str): id column of the left table
+        right_id (str): id column of the right table
+        min_sim (float): minimum similarity of a match
+
+    Returns:
+        pd.DataFrame: matches with the columns left_id, right_id, "diff" and "sim"
+    """
+    pairs = pairs.sort_values("sim", ascending=False, kind="stable")
+    rank = pairs.groupby(left_id, sort=False).cumcount()
+    best_sim = pairs[rank == 0].set_index(left_id)["sim"]
+    second_sim = pairs[rank == 1].set_index(left_id)["sim"]
+
+    pairs = pairs[pairs["sim"] >= min_sim]
+    matched_left, matched_right, selected = set(), set(), []
+    for i, (left, right) in enumerate(zip(pairs[left_id], pairs[right_id])):
+        if left not in matched_left and right not in matched_right:
+            matched_left.add(left)
+            matched_right.add(right)
+            selected.append(i)
+
+    matches = pairs.iloc[selected].copy()
+    best = matches[left_id].map(best_sim)
+    other = (
+        matches[left_id].map(second_sim).fillna(0).where(matches["sim"] >= best, best)
+    )
+    matches["diff"] = matches["sim"] - other
+    return matches[[left_id, right_id, "diff", "sim"]]
+
+
+def _get_location_block(locations: pd.Series) -> pd.Series:
+    """Returns the country of each location, or the full location ("United States, <state>") in the United States"""
+    countries = locations.str.split(",").str[0]
+    return locations.where(countries == "United States", countries)
+
+
+def match_breweries(
+    breweries_ba: pd.DataFrame, breweries_rb: pd.DataFrame, min_sim: float = 0.6
+) -> pd.DataFrame:
+    """Matches the breweries of BeerAdvocate and RateBeer
+
+    Breweries are only compared with the breweries of the same country, or of the same
+    state for the breweries of the United States.
+
+    Args:
+        breweries_ba (pd.DataFrame): breweries of BeerAdvocate, with at least the columns
+            "brewery_id_ba", "brewery_name_ba" and "brewery_location_ba"
+        breweries_rb (pd.DataFrame): breweries of RateBeer, with at least the columns
+            "brewery_id_rb", "brewery_name_rb" and "brewery_location_rb"
+        min_sim (float, optional): minimum similarity of the names of matched breweries. Defaults to 0.6.
+
+    Returns:
+        pd.DataFrame: one row per matched pair with the columns of both tables and the
+        "diff" and "sim" scores, as in the matched breweries dataset
+    """
+    breweries_ba = breweries_ba.assign(
+        block=_get_location_block(breweries_ba["brewery_location_ba"])
+    )
+    breweries_rb = breweries_rb.assign(
+        block=_get_location_block(breweries_rb["brewery_location_rb"])
+    )
+
+    pairs = _get_candidate_pairs(
+        breweries_ba,
+        breweries_rb,
+        "brewery_id_ba",
+        "brewery_id_rb",
+        "brewery_name_ba",
+        "brewery_name_rb",
+        block="block",
+        min_sim=min_sim,
+        stop_words=BREWERY_STOP_WORDS,
+    )
+    matches = _select_matches(pairs, "brewery_id_ba", "brewery_id_rb", min_sim)
+
+    return (
+        matches.merge(breweries_ba.drop(columns="block"), on="brewery_id_ba")
+        .merge(breweries_rb.drop(columns="block"), on="brewery_id_rb")
+        .reindex(
+            columns=list(breweries_ba.columns.drop("block"))
+            + list(breweries_rb.columns.drop("block"))
+            + ["diff", "sim"]
+        )
+    )
+
+
+def match_beers(
+    beers_ba: pd.DataFrame,
+    beers_rb: pd.DataFrame,
+    brewery_matches: pd.DataFrame,
+    min_sim: float = 0.6,
+    abv_tolerance: float = 0.5,
+) -> pd.DataFrame:
+    """Matches the beers of BeerAdvocate and RateBeer
+
+    Beers are only compared with the beers of the matched brewery, and pairs whose ABV
+    differ by more than abv_tolerance are discarded (pairs with an unknown ABV are kept).
+
+    Args:
+        beers_ba (pd.DataFrame): beers of BeerAdvocate, with at least the columns
+            "beer_id_ba", "beer_name_ba", "brewery_id_ba" and "abv_ba"
+        beers_rb (pd.DataFrame): beers of RateBeer, with at least the columns
+            "beer_id_rb", "beer_name_rb", "brewery_id_rb" and "abv_rb"
+        brewery_matches (pd.DataFrame): matched breweries, with the columns "brewery_id_ba" and "brewery_id_rb"
+        min_sim (float, optional): minimum similarity of the names of matched beers. Defaults to 0.6.
+        abv_tolerance (float, optional): maximum difference of ABV of matched beers. Defaults to 0.5.
+
+    Returns:
+        pd.DataFrame: one row per matched pair with the columns of both tables and the
+        "diff" and "sim" scores
+    """
+    # Block the BeerAdvocate beers on the RateBeer id of their brewery
+    brewery_block = brewery_matches.set_index("brewery_id_ba")["brewery_id_rb"]
+    beers_ba_blocked = beers_ba.assign(
+        block=beers_ba["brewery_id_ba"].map(brewery_block)
+    ).dropna(subset=["block"])
+    beers_rb_blocked = beers_rb.assign(block=beers_rb["brewery_id_rb"])
+
+    pairs = _get_candidate_pairs(
+        beers_ba_blocked,
+        beers_rb_blocked,
+        "beer_id_ba",
+        "beer_id_rb",
+        "beer_name_ba",
+        "beer_name_rb",
+        block="block",
+        min_sim=min_sim,
+    )
+
+    abv_diff = np.abs(
+        pairs["beer_id_ba"].map(beers_ba.set_index("beer_id_ba")["abv_ba"]).to_numpy()
+        - pairs["beer_id_rb"].map(beers_rb.set_index("beer_id_rb")["abv_rb"]).to_numpy()
+    )
+    pairs = pairs[~(abv_diff > abv_tolerance)]
+
+    matches = _select_matches(pairs, "beer_id_ba", "beer_id_rb", min_sim)
+
+    return (
+        matches.merge(beers_ba, on="beer_id_ba")
+        .merge(beers_rb, on="beer_id_rb")
+        .reindex(
+            columns=list(beers_ba.columns) + list(beers_rb.columns) + ["diff", "sim"]
+        )
+    )
@@ -0,0 +1,325 @@
+"""
+pipeline.py
+
+This file contains a small runner for the loading pipeline of load_data.ipynb.
+
+Each step of the pipeline is declared as a stage with its input stages, source files and
+parameters. The result of each stage is persisted (as a pickle) together with a key hashing
+the code of the module of the stage, the content of its source files, its parameters and the keys of its
+inputs. When the pipeline is run again, only the stages whose key changed are re-executed,
+and independent stages (e.g. the BeerAdvocate and RateBeer reviews) run concurrently.
+
+Usage:
+    python pipeline.py --data-dir data --jobs 4 --output data/us_users_ratings.csv --verbose
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from data_loader import (
+    get_users_df,
+    get_reviews_df,
+    get_beers_df,
+    get_breweries_df,
+    join_breweries_on_beers,
+    merge_reviews,
+    get_us_reviews,
+)
+
+# function is called with the results of the input stages as positional arguments,
+# followed by the files and the params as keyword arguments
+Stage = namedtuple("Stage", ["function", "inputs", "files", "params"])
+
+logger = logging.getLogger(__name__)
+
+
+def get_stages(data_dir: str = "data", min_reviews_per_beer: int = 10) -> dict:
+    """Returns the stages of the loading pipeline of load_data.ipynb
+
+    Args:
+        data_dir (str, optional): directory containing the datasets. Defaults to "data".
+        min_reviews_per_beer (int, optional): see get_us_reviews. Defaults to 10.
+
+    Returns:
+        dict: stage name -> Stage
+    """
+
+    def path(*parts):
+        return os.path.join(data_dir, *parts)
+
+    return {
+        "users_ba": Stage(get_users_df, [], {"users_path": path("users_ba.csv")}, {}),
+        "users_rb": Stage(get_users_df, [], {"users_path": path("users_rb.csv")}, {}),
+        "reviews_ba": Stage(
+            get_reviews_df,
+            [],
+            {"review_path": path("matched_beer_data", "ratings_ba.txt")},
+            {},
+        ),
+        "reviews_rb": Stage(
+            get_reviews_df,
+            [],
+            {"review_path": path("matched_beer_data", "ratings_rb.txt")},
+            {},
+        ),
+        "breweries": Stage(
+            get_breweries_df,
+            [],
+            {"breweries_path": path("matched_beer_data", "breweries.csv")},
+            {},
+        ),
+        "beers_unjoined": Stage(
+            get_beers_df,
+            [],
+            {"beers_path": path("matched_beer_data", "beers.csv")},
+            {},
+        ),
+        "beers": Stage(
+            join_breweries_on_beers, ["beers_unjoined", "breweries"], {}, {}
+        ),
+        "reviews": Stage(
+            merge_reviews,
+            ["reviews_ba", "reviews_rb", "beers", "users_ba", "users_rb"],
+            {},
+            {},
+        ),
+        "climate_classifications": Stage(
+            pd.read_csv,
+            [],
+            {"filepath_or_buffer": path("climate_classified.csv")},
+            {"index_col": "climate"},
+        ),
+        "states_climate": Stage(
+            pd.read_csv,
+            [],
+            {"filepath_or_buffer": path("states_climate.csv")},
+            {"index_col": "State"},
+        ),
+        "general_style": Stage(
+            pd.read_csv, [], {"filepath_or_buffer": path("general_styles.csv")}, {}
+        ),
+        "us_reviews": Stage(
+            get_us_reviews,
+            ["reviews", "climate_classifications", "states_climate", "general_style"],
+            {},
+            {"min_reviews_per_beer": min_reviews_per_beer},
+        ),
+    }
+
+
+def _hash_file(path: str, file_hashes: dict) -> str:
+    """Returns the sha256 of the content of the file
+
+    The hashes are memoized in file_hashes by (path, size, modification time), so that
+    the large review files are only read again when they change.
+    """
+    stat = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    if fingerprint not in file_hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        file_hashes[fingerprint] = sha.hexdigest()
+    return file_hashes[fingerprint]
+
+
+def _hash_function(function) -> str:
+    """Returns an identifier of the function that changes when its code changes
+
+    The whole source of the module defining the function is hashed, so that editing
+    one of the helpers it calls (e.g. _read_csv or get_beer_stats) also changes the key.
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+    try:
+        source = inspect.getsource(sys.modules[function.__module__])
+    except (KeyError, OSError, TypeError):
+        source = ""
+    return name + ":" + hashlib.sha256(source.encode()).hexdigest()
+
+
+def get_stage_keys(stages: dict, file_hashes: dict) -> dict:
+    """Returns the key of each stage, hashing its code, files, params and the keys of its inputs
+
+    Args:
+        stages (dict): stage name -> Stage
+        file_hashes (dict): memo of the hashes of the files (see _hash_file)
+
+    Returns:
+        dict: stage name -> key
+    """
+    keys = {}
+
+    def key(name):
+        if name not in keys:
+            stage = stages[name]
+            description = {
+                "function": _hash_function(stage.function),
+                "inputs": [key(input_name) for input_name in stage.inputs],
+                "files": {
+                    argument: _hash_file(path, file_hashes)
+                    for argument, path in stage.files.items()
+                },
+                "params": {
+                    argument: repr(value) for argument, value in stage.params.items()
+                },
+            }
+            keys[name] = hashlib.sha256(
+                json.dumps(description, sort_keys=True).encode()
+            ).hexdigest()
+        return keys[name]
+
+    for name in stages:
+        key(name)
+    return keys
+
+
+def _run_stage(stage: Stage, input_paths: list, output_path: str) -> None:
+    """Runs the stage on the persisted results of its inputs and persists its result"""
+    inputs = [pd.read_pickle(path) for path in input_paths]
+    result = stage.function(*inputs, **stage.files, **stage.params)
+    pd.to_pickle(result, output_path)
+
+
+def _get_dependencies(stages: dict, target: str) -> list:
+    """Returns the target and all the stages it depends on"""
+    dependencies = [target]
+    for name in dependencies:
+        dependencies += [
+            input_name
+            for input_name in stages[name].inputs
+            if input_name not in dependencies
+        ]
+    return dependencies
+
+
+def run_pipeline(
+    stages: dict,
+    store_dir: str,
+    target: str = "us_reviews",
+    n_jobs: int = 1,
+    force: bool = False,
+):
+    """Runs the stages needed to compute the target, re-executing only the stale ones
+
+    Args:
+        stages (dict): stage name -> Stage (see get_stages)
+        store_dir (str): directory in which the results and the keys of the stages are persisted
+        target (str, optional): stage to compute. Defaults to "us_reviews".
+        n_jobs (int, optional): number of stages run concurrently. Defaults to 1.
+        force (bool, optional): if True, all the stages are re-executed. Defaults to False.
+
+    Returns:
+        result of the target stage
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    file_hashes_path = os.path.join(store_dir, "file_hashes.json")
+    file_hashes = {}
+    if os.path.exists(file_hashes_path):
+        with open(file_hashes_path) as f:
+            file_hashes = json.load(f)
+
+    needed = _get_dependencies(stages, target)
+    keys = get_stage_keys({name: stages[name] for name in needed}, file_hashes)
+    with open(file_hashes_path, "w") as f:
+        json.dump(file_hashes, f)
+
+    def output_path(name):
+        return os.path.join(store_dir, name + ".pkl")
+
+    def key_path(name):
+        return os.path.join(store_dir, name + ".key")
+
+    def is_fresh(name):
+        if force or not os.path.exists(output_path(name)):
+            return False
+        if not os.path.exists(key_path(name)):
+            return False
+        with open(key_path(name)) as f:
+            return f.read() == keys[name]
+
+    stale = [name for name in needed if not is_fresh(name)]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        running = {}
+        while stale or running:
+            # Submit the stale stages whose inputs are all up to date
+            for name in list(stale):
+                if all(
+                    input_name not in stale and input_name not in running.values()
+                    for input_name in stages[name].inputs
+                ):
+                    logger.info("Running stage %s", name)
+                    future = executor.submit(
+                        _run_stage,
+                        stages[name],
+                        [output_path(input_name) for input_name in stages[name].inputs],
+                        output_path(name),
+                    )
+                    running[future] = name
+                    stale.remove(name)
+
+            if not running:
+                raise ValueError(
+                    "The stages " + ", ".join(stale) + " have cyclic inputs"
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                future.result()
+                with open(key_path(name), "w") as f:
+                    f.write(keys[name])
+
+    return pd.read_pickle(output_path(target))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the loading pipeline, re-executing only the stale stages"
+    )
+    parser.add_argument("--data-dir", default="data", help="directory of the datasets")
+    parser.add_argument(
+        "--store-dir",
+        default=os.path.join("data", "pipeline"),
+        help="directory in which the results of the stages are persisted",
+    )
+    parser.add_argument("--target", default="us_reviews", help="stage to compute")
+    parser.add_argument("--min-reviews-per-beer", type=int, default=10)
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="number of stages run concurrently"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="re-execute all the stages"
+    )
+    parser.add_argument(
+        "--output", default=None, help="gzipped csv file to save the target to"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="log the stages being run"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(message)s",
+    )
+
+    stages = get_stages(args.data_dir, args.min_reviews_per_beer)
+    result = run_pipeline(
+        stages, args.store_dir, target=args.target, n_jobs=args.jobs, force=args.force
+    )
+    if args.output is not None:
+        result.to_csv(args.output, compression="gzip", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ pretty_plot.py
 This file contains functions for making pretty plots.
 """
 
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -16,8 +22,152 @@ from matplotlib.colors import Normalize
 from PIL import Image
 
 
+US_MAP_PATH = "data/Maps/US/cb_2018_us_state_500k.shp"
+STATES_CLIMATE_PATH = "data/states_climate.csv"
+# GeoParquet copy of the merged and shifted map, used when pyarrow is installed
+US_MAP_CACHE_PATH = "data/Maps/US/us_climate_map.parquet"
+# Simplification tolerance (in degrees) of the state geometries, well below the size of a pixel on a 8x7 figure
+MAP_TOLERANCE = 0.02
+
+
+@lru_cache(maxsize=None)
+def _load_us_climate_map(map_path, states_climate_path, cache_path):
+    """
+    Loads the map of the states, adds their climate and moves Alaska and Hawaii.
+    Memoized so that the shapefile is only parsed once per process, use get_us_climate_map instead.
+    """
+    if cache_path is not None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            cache_path = None
+
+    sources = [map_path, states_climate_path]
+    if (
+        cache_path is not None
+        and os.path.exists(cache_path)
+        and os.path.getmtime(cache_path) >= max(map(os.path.getmtime, sources))
+    ):
+        return gpd.read_parquet(cache_path)
+
+    us_map = gpd.read_file(map_path)
+    states_climate = pd.read_csv(states_climate_path)
+
+    # Add climate column to us_map
+    us_map = us_map.merge(states_climate, left_on="NAME", right_on="State")
+
+    # For display purposes, move Alaska and Hawaii to the East
+    shifted = us_map["NAME"].isin(["Alaska", "Hawaii"])
+    us_map.loc[shifted, "geometry"] = us_map.loc[shifted, "geometry"].translate(
+        xoff=40
+    )
+
+    if cache_path is not None:
+        us_map.to_parquet(cache_path)
+
+    return us_map
+
+
+@lru_cache(maxsize=None)
+def _simplify_us_climate_map(map_path, states_climate_path, cache_path, tolerance):
+    """
+    Simplifies the geometries of the full resolution map with the given tolerance.
+    The states are simplified as a coverage when possible, so that the borders shared by neighbouring states stay identical (no gaps nor overlaps).
+    Memoized so that each level of detail is only computed once per process, use get_us_climate_map instead.
+    """
+    us_map = _load_us_climate_map(map_path, states_climate_path, cache_path).copy()
+    try:
+        us_map["geometry"] = us_map.geometry.simplify_coverage(tolerance)
+    except (AttributeError, ImportError):
+        # simplify_coverage requires geopandas>=1.1, shapely>=2.1 and GEOS>=3.12: older versions
+        # simplify each state on its own, so the shared borders may not match exactly
+        us_map["geometry"] = us_map.geometry.simplify(
+            tolerance, preserve_topology=True
+        )
+    return us_map
+
+
+def get_us_climate_map(
+    map_path=US_MAP_PATH,
+    states_climate_path=STATES_CLIMATE_PATH,
+    cache_path=US_MAP_CACHE_PATH,
+    tolerance=MAP_TOLERANCE,
+):
+    """
+    This function returns the map of the United States with the climate of each state, Alaska and Hawaii being moved to the East for display purposes.
+    The map is loaded, merged and shifted only once per process, the following calls return a copy of the cached map.
+    By default the geometries are simplified, as the census file has far more vertices than a figure can show.
+
+    Args:
+        map_path (str, optional): Path to the shapefile of the states. Defaults to US_MAP_PATH.
+        states_climate_path (str, optional): Path to the csv file with the climate of each state. Defaults to STATES_CLIMATE_PATH.
+        cache_path (str, optional): Path to a GeoParquet file in which the map is stored, so that new processes do not parse the shapefile either.
+            The file is rebuilt if it is older than the sources. It always contains the full resolution map. It is ignored if pyarrow
+            is not installed, or if None. Defaults to US_MAP_CACHE_PATH.
+        tolerance (float, optional): Tolerance (in degrees) of the coverage-preserving simplification of the geometries.
+            If None, the full resolution geometries are returned. Defaults to MAP_TOLERANCE.
+
+    Returns:
+        gpd.GeoDataFrame: GeoDataFrame with one row per state and a "Climate" column
+    """
+    if tolerance is None:
+        return _load_us_climate_map(map_path, states_climate_path, cache_path).copy()
+    return _simplify_us_climate_map(
+        map_path, states_climate_path, cache_path, tolerance
+    ).copy()
+
+
+@lru_cache(maxsize=None)
+def _dissolve_climate_map(map_path, states_climate_path, cache_path, tolerance):
+    """
+    Dissolves the states simplified at the given tolerance into one geometry per climate,
+    so that the edges of the climates are exactly the ones of the states drawn on top of them.
+    Memoized so that each level of detail is only computed once per process, use get_climate_map instead.
+    """
+    if tolerance is None:
+        us_map = _load_us_climate_map(map_path, states_climate_path, cache_path)
+    else:
+        us_map = _simplify_us_climate_map(
+            map_path, states_climate_path, cache_path, tolerance
+        )
+    return us_map[["Climate", "geometry"]].dissolve(by="Climate", as_index=False)
+
+
+def get_climate_map(
+    map_path=US_MAP_PATH,
+    states_climate_path=STATES_CLIMATE_PATH,
+    cache_path=US_MAP_CACHE_PATH,
+    tolerance=MAP_TOLERANCE,
+):
+    """
+    This function returns the map of the United States with the states dissolved by climate, i.e. one geometry per climate.
+    As the plotted values only depend on the climate, this map is much cheaper to join and to render than the map of the states.
+    It is computed only once per process, the following calls return a copy of the cached map.
+
+    Args:
+        map_path (str, optional): Path to the shapefile of the states. Defaults to US_MAP_PATH.
+        states_climate_path (str, optional): Path to the csv file with the climate of each state. Defaults to STATES_CLIMATE_PATH.
+        cache_path (str, optional): Path to the GeoParquet cache of the map of the states, see get_us_climate_map. Defaults to US_MAP_CACHE_PATH.
+        tolerance (float, optional): Tolerance (in degrees) of the simplification of the states, see get_us_climate_map.
+            If None, the full resolution geometries are returned. Defaults to MAP_TOLERANCE.
+
+    Returns:
+        gpd.GeoDataFrame: GeoDataFrame with one row per climate and a "Climate" column
+    """
+    return _dissolve_climate_map(
+        map_path, states_climate_path, cache_path, tolerance
+    ).copy()
+
+
 def plot_climate_one_stat(
-    df, column, title, column_ticks=None, cmap_name="YlOrRd"
+    df,
+    column,
+    title,
+    column_ticks=None,
+    cmap_name="YlOrRd",
+    tolerance=MAP_TOLERANCE,
+    state_boundaries=True,
+    cache_path=US_MAP_CACHE_PATH,
 ):  # RdBu_r
     """
     This function plots on a map of the United States the mean of the column passed as an argument for each state depending on its climate.
@@ -29,28 +179,24 @@ def plot_climate_one_stat(
         title (str): Title of the plot
         column_ticks (list, optional): List of strings to use as ticks on the colorbar. Defaults to None.
         cmap_name (str, optional): Name of the colormap to use. Defaults to "YlOrRd".
+        tolerance (float, optional): Simplification tolerance of the state geometries, None to use the full resolution map. Defaults to MAP_TOLERANCE.
+        state_boundaries (bool, optional): If True, the boundaries of the states are drawn on top of the climates. If False, only the boundaries of the climates are drawn. Defaults to True.
+        cache_path (str, optional): Path to the GeoParquet cache of the map, see get_us_climate_map. Defaults to US_MAP_CACHE_PATH.
     """
 
-    us_map = gpd.read_file("data/Maps/US/cb_2018_us_state_500k.shp")
-    states_climate = pd.read_csv("data/states_climate.csv")
-
-    # Add climate column to us_map and the df
-    us_map = us_map.merge(states_climate, left_on="NAME", right_on="State")
-    us_map = us_map.merge(df, left_on="Climate", right_on="climate")
-
-    # For display purposes, move Alaska and Hawaii to the East
-    alaska = us_map[us_map["NAME"] == "Alaska"].geometry
-    hawaii = us_map[us_map["NAME"] == "Hawaii"].geometry
-
-    alaska = alaska.translate(xoff=40)
-    hawaii = hawaii.translate(xoff=40)
-
-    us_map_shifted = us_map.copy()
-    us_map_shifted.loc[us_map_shifted["NAME"] == "Alaska", "geometry"] = alaska
-    us_map_shifted.loc[us_map_shifted["NAME"] == "Hawaii", "geometry"] = hawaii
+    # Add the values of the df to the (cached) map of the climates
+    climate_map = get_climate_map(cache_path=cache_path, tolerance=tolerance).merge(
+        df, left_on="Climate", right_on="climate"
+    )
+    if state_boundaries:
+        boundaries = get_us_climate_map(
+            cache_path=cache_path, tolerance=tolerance
+        ).boundary
+    else:
+        boundaries = climate_map.boundary
 
     fig, ax = plt.subplots(figsize=(8, 7))
-    us_map_shifted.boundary.plot(ax=ax, linewidth=1, color="black")
+    boundaries.plot(ax=ax, linewidth=1, color="black")
 
     # Plot on the colorbar only the unique values associated to the each climate type
     values = df[column].unique()
@@ -59,7 +205,7 @@ def plot_climate_one_stat(
     sm = cm.ScalarMappable(cmap=cmap_name, norm=norm)
     sm.set_array([])
 
-    us_map_shifted.plot(
+    climate_map.plot(
         column=column,
         cmap=cmap_name,
         ax=ax,
@@ -92,6 +238,9 @@ def plot_climate_multiple_stats(
     cmap_name="YlOrRd",
     figsize=(8, 7),
     separate_colorbars=False,
+    tolerance=MAP_TOLERANCE,
+    state_boundaries=True,
+    cache_path=US_MAP_CACHE_PATH,
 ):
     """
     This function plots on a map of the United States the mean of the column passed as an argument for each state depending on its climate.
@@ -105,25 +254,21 @@ def plot_climate_multiple_stats(
         cmap_name (str, optional): Name of the colormap to use. Defaults to "YlOrRd".
         figsize (tuple, optional): Size of the figure. Defaults to (8, 7). It is to be noted that if mutiple plots are displayed, the figsize is multiplied by the number of plots along the x-axis.
         separate_colorbars (bool, optional): If True, each plot has its own colorbar. If False, all the plots share the same colorbar. Defaults to False.
+        tolerance (float, optional): Simplification tolerance of the state geometries, None to use the full resolution map. Defaults to MAP_TOLERANCE.
+        state_boundaries (bool, optional): If True, the boundaries of the states are drawn on top of the climates. If False, only the boundaries of the climates are drawn. Defaults to True.
+        cache_path (str, optional): Path to the GeoParquet cache of the map, see get_us_climate_map. Defaults to US_MAP_CACHE_PATH.
     """
 
-    us_map = gpd.read_file("data/Maps/US/cb_2018_us_state_500k.shp")
-    states_climate = pd.read_csv("data/states_climate.csv")
-
-    # Add climate column to us_map and the df
-    us_map = us_map.merge(states_climate, left_on="NAME", right_on="State")
-    us_map = us_map.merge(df, left_on="Climate", right_on="climate")
-
-    # For display purposes, move Alaska and Hawaii to the East
-    alaska = us_map[us_map["NAME"] == "Alaska"].geometry
-    hawaii = us_map[us_map["NAME"] == "Hawaii"].geometry
-
-    alaska = alaska.translate(xoff=40)
-    hawaii = hawaii.translate(xoff=40)
-
-    us_map_shifted = us_map.copy()
-    us_map_shifted.loc[us_map_shifted["NAME"] == "Alaska", "geometry"] = alaska
-    us_map_shifted.loc[us_map_shifted["NAME"] == "Hawaii", "geometry"] = hawaii
+    # Add the values of the df to the (cached) map of the climates
+    climate_map = get_climate_map(cache_path=cache_path, tolerance=tolerance).merge(
+        df, left_on="Climate", right_on="climate"
+    )
+    if state_boundaries:
+        boundaries = get_us_climate_map(
+            cache_path=cache_path, tolerance=tolerance
+        ).boundary
+    else:
+        boundaries = climate_map.boundary
 
     num_plots = len(columns)
     figsize = (figsize[0] * num_plots, figsize[1])
@@ -135,7 +280,7 @@ def plot_climate_multiple_stats(
         vmax = df[columns].max().max()
 
     for i in range(num_plots):
-        us_map_shifted.boundary.plot(ax=axes[i], linewidth=1, color="black")
+        boundaries.plot(ax=axes[i], linewidth=1, color="black")
 
         # Plot on the colorbar only the unique values associated to the each climate type
         values = df[columns[i]].unique()
@@ -149,7 +294,7 @@ def plot_climate_multiple_stats(
         sm = cm.ScalarMappable(cmap=cmap_name, norm=norm)
         sm.set_array([])
 
-        us_map_shifted.plot(
+        climate_map.plot(
             column=columns[i],
             cmap=cmap_name,
             ax=axes[i],
@@ -236,6 +381,53 @@ def spider_plot(
     plt.show()
 
 
+BEER_IMAGE_PATH = "data/images/beer2.png"
+
+
+@lru_cache(maxsize=None)
+def _load_beer_glass(image_path=BEER_IMAGE_PATH):
+    """
+    Loads the image of the beer glass and the mask of its inside once per process.
+    The returned arrays are read-only as they are shared between calls.
+    """
+    img = plt.imread(image_path)
+
+    mask = np.array(Image.open(image_path).convert("L")) > 1
+    mask = ~mask
+
+    img.setflags(write=False)
+    mask.setflags(write=False)
+    return img, mask
+
+
+def _fill_beer_glasses(fill_percentages, image_path=BEER_IMAGE_PATH):
+    """
+    Returns the images of the beer glass filled at each of the given percentages, as one (N, H, W, 4) array.
+    A fill percentage of 0 is a full glass, 1 an empty one.
+    """
+    img, mask = _load_beer_glass(image_path)
+
+    # Area of the glass that can be filled, in pixels
+    x_center = 145
+    width = 116
+    height_max = 350
+    y_max = 450
+
+    # For each glass, the rows between the top of the beer and the bottom of the glass are filled
+    rows = np.arange(img.shape[0])
+    top = (y_max - np.asarray(fill_percentages) * height_max).astype(int)
+    filled_rows = (rows >= top[:, None]) & (rows < y_max)
+
+    filled_columns = np.zeros(img.shape[1], dtype=bool)
+    filled_columns[x_center - width : x_center + width] = True
+
+    # Only fill the inside of the glass
+    filled = filled_rows[:, :, None] & (filled_columns & mask)[None]
+
+    color = np.array((1, 0.6, 0, 1), dtype=img.dtype)
+    return img + filled[..., None] * color
+
+
 def plot_on_beers(
     df,
     column,
@@ -255,44 +447,20 @@ def plot_on_beers(
         figsize (tuple, optional): Size of the figure. Defaults to (20, 10).
     """
 
-    img = plt.imread("data/images/beer2.png")
-
-    mask = np.array(Image.open("data/images/beer2.png").convert("L")) > 1
-    mask = ~mask
+    values = df[column].to_numpy()
+    images = _fill_beer_glasses(1 - values / 10)
 
     num_rows = df.shape[0]
     fig, axs = plt.subplots(1, num_rows, figsize=figsize)
+    axs = np.atleast_1d(axs)
 
-    i = 0
-    for row in df.iterrows():
-        # Create an image with the same shape as the mask
-        img_plot = np.zeros_like(img)
-
-        # in this image put red pixels
-        x_center = 145
-        width = 116
-        height_max = 350
-        y_max = 450
-
-        fill_percentage = 1 - row[1][column] / 10
-
-        img_plot[
-            int(y_max - fill_percentage * height_max) : y_max,
-            x_center - width : x_center + width,
-            ...,
-        ] = (1, 0.6, 0, 1)
-
-        # Mask the img_plot with the mask
-        img_masked = img_plot * mask[..., None]
-
-        img_masked = img_masked + img
-
-        axs[i].imshow(img_masked)
-        axs[i].set_title(row[1][column_ticks])
+    for i, (value, tick) in enumerate(zip(values, df[column_ticks])):
+        axs[i].imshow(images[i])
+        axs[i].set_title(tick)
         axs[i].text(
             0.43,
             0.13,
-            str(row[1][column]),
+            str(value),
             fontsize=15,
             color="black",
             horizontalalignment="center",
@@ -300,7 +468,59 @@ def plot_on_beers(
             transform=axs[i].transAxes,
         )
         axs[i].axis("off")
-        i += 1
 
     plt.suptitle(title, y=0.65)
     plt.show()
+
+
+def _init_render_worker():
+    """
+    Sets the Agg backend in a process rendering plot specs, see render_figures.
+    """
+    plt.switch_backend("Agg")
+
+
+def _render_figure(spec):
+    """
+    Renders one plot spec to its file and closes the figure, in a process initialized by _init_render_worker, see render_figures.
+    """
+    function = spec["function"]
+    if isinstance(function, str):
+        function = globals()[function]
+
+    try:
+        with warnings.catch_warnings():
+            # The plot functions call plt.show(), which does nothing with the Agg backend
+            warnings.filterwarnings("ignore", message=".*non-interactive.*")
+            function(*spec.get("args", ()), **spec.get("kwargs", {}))
+        plt.gcf().savefig(spec["path"], bbox_inches="tight", dpi=spec.get("dpi"))
+    finally:
+        plt.close("all")
+
+    return spec["path"]
+
+
+def render_figures(specs, n_jobs=1):
+    """
+    This function renders a list of plots to files without displaying them, e.g. to regenerate the figures/ directory from a script or a notebook.
+    The specs are rendered in n_jobs worker processes using the Agg backend, so that the backend and the open figures of the caller are left untouched.
+    Each figure is closed right after being saved, so that memory does not grow.
+
+    Args:
+        specs (list): List of dicts with the keys:
+            - "function": plot function of this file, or its name (e.g. "plot_climate_one_stat")
+            - "path": path of the file to save the figure to
+            - "args" / "kwargs" (optional): arguments of the plot function
+            - "dpi" (optional): resolution of the saved figure. Defaults to the matplotlib default.
+        n_jobs (int, optional): Number of worker processes used to render the specs. Defaults to 1.
+
+    Returns:
+        list: Paths of the saved figures, in the order of the specs
+    """
+    # Spawned workers do not inherit the figures and the GUI state of the caller
+    with ProcessPoolExecutor(
+        max_workers=n_jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_render_worker,
+    ) as executor:
+        return list(executor.map(_render_figure, specs))
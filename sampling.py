@@ -0,0 +1,152 @@
+"""
+sampling.py
+
+This file contains functions for drawing stratified samples of the reviews, to iterate
+quickly on an analysis before running it on the full data, and for computing unbiased
+grouped statistics with their standard errors on such samples.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+STRATA = ["climate"]
+
+
+def stratified_sample(
+    df: pd.DataFrame,
+    n: int,
+    strata: list = STRATA,
+    seed: int = None,
+    min_per_stratum: int = 2,
+) -> pd.DataFrame:
+    """Returns a sample of about n rows, stratified by the given columns
+
+    Each stratum is sampled without replacement proportionally to its size, with at least
+    min_per_stratum rows (or the whole stratum if it is smaller). The sample keeps the
+    columns needed to compute unbiased statistics (see get_weighted_group_stats):
+    - "stratum": code of the stratum of the row
+    - "stratum_size": number of rows of the stratum in df
+    - "weight": number of rows of df represented by the row, i.e. stratum size / sample size of the stratum
+
+    Args:
+        df (pd.DataFrame): dataframe of the reviews (e.g. output of get_us_reviews)
+        n (int): target size of the sample
+        strata (list, optional): columns defining the strata, e.g. ["climate", "general_style"]. Defaults to STRATA.
+        seed (int, optional): seed of the random generator. Defaults to None.
+        min_per_stratum (int, optional): minimum number of rows sampled in each stratum. Defaults to 2.
+
+    Returns:
+        pd.DataFrame: sampled rows, with the additional columns "stratum", "stratum_size" and "weight"
+    """
+    rng = np.random.default_rng(seed)
+
+    # Rows with a missing stratum value form their own stratum
+    stratum = df.groupby(strata, dropna=False, sort=False).ngroup().to_numpy()
+    stratum_size = np.bincount(stratum)
+    sample_size = np.round(n * stratum_size / len(df)).astype(int)
+    sample_size = np.minimum(np.maximum(sample_size, min_per_stratum), stratum_size)
+
+    # Keep the first sample_size rows of each stratum in a random order
+    order = np.lexsort((rng.random(len(df)), stratum))
+    first_of_stratum = np.concatenate(([0], np.cumsum(stratum_size)[:-1]))
+    rank = np.arange(len(df)) - first_of_stratum[stratum[order]]
+    selected = np.sort(order[rank < sample_size[stratum[order]]])
+
+    sample = df.iloc[selected].copy()
+    sample["stratum"] = stratum[selected]
+    sample["stratum_size"] = stratum_size[sample["stratum"]]
+    sample["weight"] = sample["stratum_size"] / sample_size[sample["stratum"]]
+    return sample
+
+
+def _get_stratified_variance(
+    sample: pd.DataFrame, z: np.ndarray, groups: pd.Series
+) -> pd.Series:
+    """Returns, for each group, the variance of the estimator of the total of z
+
+    z is zero outside of the group, so the sums over a (stratum, group) pair are the sums
+    over the stratum, which all the rows of the stratum contribute to.
+
+    A stratum sampled entirely contributes no variance. The variance of a stratum with a
+    single sampled row out of several cannot be estimated, so the variance of the groups it
+    contributes to is NaN.
+    """
+    strata = sample.groupby("stratum")
+    n_h = strata.size()
+    N_h = strata["stratum_size"].first()
+
+    sums = (
+        pd.DataFrame(
+            {"z": z, "z2": z**2, "stratum": sample["stratum"], "group": groups}
+        )
+        .groupby(["group", "stratum"], observed=True)[["z", "z2"]]
+        .sum()
+    )
+    stratum = sums.index.get_level_values("stratum")
+    n = n_h.reindex(stratum).to_numpy()
+    N = N_h.reindex(stratum).to_numpy()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance_h = (sums["z2"].to_numpy() - sums["z"].to_numpy() ** 2 / n) / (n - 1)
+    contribution = np.where(
+        n == N, 0.0, np.where(n < 2, np.nan, N**2 * (1 - n / N) * variance_h / n)
+    )
+
+    contribution = pd.Series(contribution, index=sums.index).groupby(level="group")
+    return contribution.sum().mask(contribution.apply(lambda c: c.isna().any()))
+
+
+def get_weighted_group_stats(
+    sample: pd.DataFrame, group_column: str, value_column: str
+) -> pd.DataFrame:
+    """Returns the estimated number of rows and mean of the value of each group, with their standard errors
+
+    The estimates are weighted by the inverse of the sampling probability of each row, so
+    they are unbiased for the full dataframe the sample was drawn from, even when the groups
+    are not the strata of the sample (e.g. general styles on a sample stratified by climate).
+
+    Args:
+        sample (pd.DataFrame): output of stratified_sample
+        group_column (str): column defining the groups (e.g. "climate")
+        value_column (str): column of which the mean is computed (e.g. "overall")
+
+    Returns:
+        pd.DataFrame: dataframe indexed by the groups, with the columns "count", "count_std_err",
+        "mean", "mean_std_err" and "sample_size"
+    """
+    groups = sample[group_column]
+    values = sample[value_column].to_numpy(dtype=float)
+    weights = sample["weight"].to_numpy()
+    has_value = ~np.isnan(values)
+
+    weighted = pd.DataFrame(
+        {
+            "group": groups,
+            "weight": weights,
+            "weighted_value": np.where(has_value, weights * values, 0),
+            "value_weight": np.where(has_value, weights, 0),
+            "has_value": has_value,
+        }
+    ).groupby("group", observed=True)
+    stats = pd.DataFrame(
+        {
+            "count": weighted["weight"].sum(),
+            "mean": weighted["weighted_value"].sum() / weighted["value_weight"].sum(),
+            "sample_size": weighted["has_value"].sum(),
+        }
+    )
+
+    # Variance of the count: total of the indicator of the group
+    count_variance = _get_stratified_variance(sample, np.ones(len(sample)), groups)
+
+    # Variance of the mean (a ratio estimator): total of the linearized residuals
+    group_mean = stats["mean"].reindex(groups).to_numpy()
+    group_total = weighted["value_weight"].sum().reindex(groups).to_numpy()
+    residuals = np.where(has_value, (values - group_mean) / group_total, 0)
+    mean_variance = _get_stratified_variance(sample, residuals, groups)
+
+    stats["count_std_err"] = np.sqrt(count_variance)
+    stats["mean_std_err"] = np.sqrt(mean_variance)
+    stats.index.name = group_column
+    return stats[["count", "count_std_err", "mean", "mean_std_err", "sample_size"]]
@@ -45,100 +45,164 @@ def get_reviews_df(review_path: str) -> pd.DataFrame:
     return reviews_df
 
 
-def get_breweries_df(breweries_path: str) -> pd.DataFrame:
+def _read_csv(
+    path: str, columns: dict, dtypes: dict, header_row: int = 0
+) -> pd.DataFrame:
+    """Reads the given columns of a csv file with compact dtypes
+
+    The multithreaded pyarrow parser is used when it is installed. The names of the
+    columns are read separately (duplicated names get the suffixes ".1", ".2", ... as
+    with pd.read_csv), as the pyarrow parser does not deduplicate them.
+
+    Args:
+        path (str): path to the csv file
+        columns (dict): name of the column in the file -> name of the column in the dataframe
+        dtypes (dict): name of the column in the dataframe -> dtype
+        header_row (int, optional): index of the row containing the names of the columns. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: dataframe with the renamed columns, in the order of the file
+    """
+    header = list(pd.read_csv(path, skiprows=header_row, nrows=0).columns)
+    positions = sorted(header.index(column) for column in columns)
+    names = [columns[header[position]] for position in positions]
+
+    try:
+        import pyarrow  # noqa: F401
+
+        engine = "pyarrow"
+    except ImportError:
+        engine = "c"
+
+    df = pd.read_csv(
+        path,
+        skiprows=header_row + 1,
+        header=None,
+        usecols=positions,
+        engine=engine,
+    )
+    df.columns = names
+    return df.astype({name: dtypes[name] for name in names if name in dtypes})
+
+
+# name in the csv file -> name in the dataframe
+BREWERIES_COLUMNS = {
+    "id": "brewery_id_ba",
+    "location": "brewery_location_ba",
+    "name": "brewery_name_ba",
+    "nbr_beers": "brewery_nbr_beers_ba",
+    "id.1": "brewery_id_rb",
+    "nbr_beers.1": "brewery_nbr_beers_rb",
+}
+BREWERIES_DTYPES = {
+    "brewery_id_ba": "int32",
+    "brewery_location_ba": "category",
+    "brewery_nbr_beers_ba": "int32",
+    "brewery_id_rb": "int32",
+    "brewery_nbr_beers_rb": "int32",
+}
+
+
+def get_breweries_df(breweries_path: str, columns: list = None) -> pd.DataFrame:
     """Returns dataframe of breweries
 
     Args:
         breweries_path (str): path to the csv file of the dataset
+        columns (list, optional): columns of the dataframe to load. Defaults to all of them.
 
     Returns:
         pd.DataFrame: dataframe of breweries
     """
 
-    # Get useful columns from csv file
-    breweries_df = pd.read_csv(
+    # Get useful columns from csv file, and rename them to distinguish between the
+    # features coming from BeerAdvocate (we use the suffix "_ba"), and RateBeer (suffix "_rb")
+    # (the first row is used to indicate what feature comes from BeerAdvocate and what feature comes from RateBeer)
+    return _read_csv(
         breweries_path,
-        skiprows=1,
-        usecols=[
-            "id",
-            "location",
-            "name",
-            "nbr_beers",
-            "id.1",
-            "nbr_beers.1",
-        ],
-    )
-
-    # rename columns to distinguish between the features coming from
-    # BeerAdvocate (we use the suffix "_ba"), and RateBeer (suffix "_rb")
-    breweries_df = breweries_df.rename(
         {
-            "id": "brewery_id_ba",
-            "location": "brewery_location_ba",
-            "name": "brewery_name_ba",
-            "nbr_beers": "brewery_nbr_beers_ba",
-            "id.1": "brewery_id_rb",
-            "nbr_beers.1": "brewery_nbr_beers_rb",
+            raw: name
+            for raw, name in BREWERIES_COLUMNS.items()
+            if columns is None or name in columns
         },
-        axis=1,
-        errors="raise",
+        BREWERIES_DTYPES,
+        header_row=1,
     )
-    return breweries_df
 
 
-def get_beers_df(beers_path: str) -> pd.DataFrame:
+# name in the csv file -> name in the dataframe. The same features come from BeerAdvocate
+# and RateBeer, they are distinguished by their suffix. (They are going to be useful to make
+# joins and merges between Dataframes)
+BEERS_COLUMNS = {
+    "beer_id": "beer_id_ba",
+    "beer_name": "beer_name_ba",
+    "brewery_id": "brewery_id_ba",
+    "nbr_ratings": "nbr_ratings_ba",
+    "style": "style_ba",
+    "abv": "abv_ba",
+    "avg_computed": "beer_avg_rating_ba",
+    "beer_id.1": "beer_id_rb",
+    "brewery_id.1": "brewery_id_rb",
+    "nbr_ratings.1": "nbr_ratings_rb",
+    "avg_computed.1": "beer_avg_rating_rb",
+}
+BEERS_DTYPES = {
+    "beer_id_ba": "int32",
+    "brewery_id_ba": "int32",
+    "nbr_ratings_ba": "int32",
+    "style_ba": "category",
+    "abv_ba": "float32",
+    "beer_avg_rating_ba": "float32",
+    "beer_id_rb": "int32",
+    "brewery_id_rb": "int32",
+    "nbr_ratings_rb": "int32",
+    "beer_avg_rating_rb": "float32",
+}
+# columns needed to compute the weighted average beer scores
+BEERS_AVG_COLUMNS = [
+    "beer_avg_rating_ba",
+    "nbr_ratings_ba",
+    "beer_avg_rating_rb",
+    "nbr_ratings_rb",
+]
+
+
+def get_beers_df(beers_path: str, columns: list = None) -> pd.DataFrame:
     """Returns dataframe of beers
 
     Args:
         beers_path (str): path to the csv file of the beers data
+        columns (list, optional): columns of the dataframe to load (including "beer_avg_rating_ba_rb"). Defaults to all of them.
 
     Returns:
         pd.DataFrame: dataframe containing beer data
     """
-
-    # Get useful columns:
-    beers_df = pd.read_csv(
+    with_avg = columns is None or "beer_avg_rating_ba_rb" in columns
+    loaded = None if columns is None else set(columns)
+    if loaded is not None and with_avg:
+        loaded.update(BEERS_AVG_COLUMNS)
+
+    # Get useful columns (the first row is used to indicate what feature comes from BeerAdvocate
+    # and what feature comes from RateBeer)
+    beers_df = _read_csv(
         beers_path,
-        skiprows=1,  # first row is used to indicate what feature comes from BeerAdvocate and what feature comes from RateBeer
-        usecols=[
-            "beer_id",
-            "beer_name",
-            "brewery_id",
-            "nbr_ratings",
-            "style",
-            "abv",
-            "avg_computed",
-            "beer_id.1",
-            "brewery_id.1",
-            "nbr_ratings.1",
-            "avg_computed.1",
-        ],
-    )
-
-    # rename columns to distinguish between the same features coming from BeerAdvocate and RateBeer
-    # (They are going to be useful to make joins and merges between Dataframes)
-    beers_df = beers_df.rename(
-        columns=lambda col: col.replace(".1", "_rb")
-        if col.endswith(".1")
-        else col + "_ba",
-        errors="raise",
-    )
-
-    # rename column name to more explicit names
-    beers_df = beers_df.rename(
         {
-            "avg_computed_ba": "beer_avg_rating_ba",
-            "avg_computed_rb": "beer_avg_rating_rb",
+            raw: name
+            for raw, name in BEERS_COLUMNS.items()
+            if loaded is None or name in loaded
         },
-        axis=1,
-        errors="raise",
+        BEERS_DTYPES,
+        header_row=1,
     )
 
-    # Compute the weighted average beer scores using data from both BA and RB
-    beers_df["beer_avg_rating_ba_rb"] = (
-        beers_df["beer_avg_rating_ba"] * beers_df["nbr_ratings_ba"]
-        + beers_df["beer_avg_rating_rb"] * beers_df["nbr_ratings_rb"]
-    ) / (beers_df["nbr_ratings_rb"] + beers_df["nbr_ratings_ba"])
+    if with_avg:
+        # Compute the weighted average beer scores using data from both BA and RB
+        beers_df["beer_avg_rating_ba_rb"] = (
+            beers_df["beer_avg_rating_ba"] * beers_df["nbr_ratings_ba"]
+            + beers_df["beer_avg_rating_rb"] * beers_df["nbr_ratings_rb"]
+        ) / (beers_df["nbr_ratings_rb"] + beers_df["nbr_ratings_ba"])
+
+    if columns is not None:
+        beers_df = beers_df[columns]
 
     return beers_df
 
@@ -170,16 +234,36 @@ def join_breweries_on_beers(
     )
 
 
-def get_users_df(users_path: str) -> pd.DataFrame:
+USERS_DTYPES = {
+    "nbr_ratings": "int32",
+    "location": "category",
+}
+
+
+def get_users_df(users_path: str, columns: list = None) -> pd.DataFrame:
     """Returns user dataframe from csv file of the dataset
 
     Args:
         users_path (str): path to csv file containing the data
+        columns (list, optional): columns to load ("user_id" is always loaded). Defaults to all of them.
 
     Returns:
         pd.DataFrame: dataframe of the users
     """
-    users = pd.read_csv(users_path)
+    header = pd.read_csv(users_path, nrows=0).columns
+    if columns is not None:
+        header = [
+            column for column in header if column in columns or column == "user_id"
+        ]
+
+    users = _read_csv(users_path, {column: column for column in header}, USERS_DTYPES)
+
+    # The ids of RateBeer are integers, the ones of BeerAdvocate are strings
+    if pd.api.types.is_integer_dtype(users["user_id"]):
+        users["user_id"] = users["user_id"].astype("int32")
+    else:
+        users["user_id"] = users["user_id"].astype("str")
+
     return users.drop_duplicates(subset="user_id", keep="first")
 
 
@@ -226,8 +310,8 @@ def merge_reviews(
     ba_df.user_id = ba_df.user_id.astype(str)
     rb_df.user_id = rb_df.user_id.astype(str)
 
-    users_df_ba.loc[:, "user_id"] = users_df_ba.user_id.astype(str)
-    users_df_rb.loc[:, "user_id"] = users_df_rb.user_id.astype(str)
+    users_df_ba = users_df_ba.astype({"user_id": str})
+    users_df_rb = users_df_rb.astype({"user_id": str})
 
     ba_df.beer_id = ba_df.beer_id.astype(int)
     rb_df.beer_id = rb_df.beer_id.astype(int)
@@ -272,8 +356,13 @@ def merge_reviews(
         how="left",
     )
 
+    # Keep track of the website each review comes from
+    ba_df["site"] = "ba"
+    rb_df["site"] = "rb"
+
     # Concatenate the reviews dataframe
     reviews_df = pd.concat([ba_df, rb_df])
+    reviews_df["site"] = reviews_df["site"].astype("category")
     reviews_df.drop(["brewery_id"], axis=1, inplace=True)
 
     if (n_reviews_ba + n_reviews_rb) != reviews_df.shape[0]:
@@ -304,13 +393,233 @@ def merge_reviews(
     return reviews_df
 
 
+SCORE_COLUMNS = ["aroma", "appearance", "palate", "taste", "overall", "rating"]
+
+
+def get_beer_stats(
+    reviews_df: pd.DataFrame,
+    score_columns: list = SCORE_COLUMNS,
+    group_column: str = None,
+) -> pd.DataFrame:
+    """Returns the review statistics of each beer, keyed by its ids on both websites
+
+    All the statistics are computed in a single grouped pass over the reviews, so that
+    filtering and ranking the beers afterwards is a plain index lookup. Beers are
+    identified by their ids and not by their names, which are not unique.
+
+    Args:
+        reviews_df (pd.DataFrame): dataframe of the reviews (see merge_reviews). If it has
+            a "site" column, per-website statistics are added.
+        score_columns (list, optional): scores to compute the sums and means of. Defaults to SCORE_COLUMNS.
+        group_column (str, optional): if given (e.g. "climate"), the statistics are computed
+            for each beer and each value of this column. Defaults to None.
+
+    Returns:
+        pd.DataFrame: dataframe indexed by ("beer_id_ba", "beer_id_rb"[, group_column]) with the
+        columns "nbr_reviews", "<score>_sum" and "<score>_mean" (and "nbr_reviews_<site>",
+        "<score>_sum_<site>" and "<score>_mean_<site>" for each website)
+    """
+    keys = ["beer_id_ba", "beer_id_rb"] + ([group_column] if group_column else [])
+    sites = ["site"] if "site" in reviews_df.columns else []
+
+    # Single grouped pass at the finest level (beer, group and website)
+    grouped = reviews_df.groupby(keys + sites, observed=True)
+    base = pd.concat(
+        [
+            grouped.size().rename("nbr_reviews"),
+            grouped[score_columns].sum().add_suffix("_sum"),
+            grouped[score_columns].count().add_suffix("_count"),
+        ],
+        axis=1,
+    )
+
+    def add_means(stats, suffix=""):
+        for score in score_columns:
+            stats[score + "_mean" + suffix] = (
+                stats[score + "_sum" + suffix] / stats[score + "_count" + suffix]
+            )
+        return stats.drop(
+            columns=[score + "_count" + suffix for score in score_columns]
+        )
+
+    beer_stats = base.groupby(level=keys, observed=True).sum()
+    beer_stats = add_means(beer_stats)
+
+    if sites:
+        for site, site_stats in base.groupby(level="site", observed=True):
+            site_stats = site_stats.droplevel("site").add_suffix("_" + site)
+            site_stats = add_means(site_stats, "_" + site)
+            beer_stats = beer_stats.join(site_stats)
+            beer_stats["nbr_reviews_" + site] = (
+                beer_stats["nbr_reviews_" + site].fillna(0).astype(int)
+            )
+
+    return beer_stats
+
+
+def get_top_beers(
+    beer_stats: pd.DataFrame,
+    column: str = "nbr_reviews",
+    n: int = 10,
+    min_reviews: int = 0,
+) -> pd.DataFrame:
+    """Returns the n beers with the highest value of the column, e.g. the most reviewed
+    beers or the best rated ones
+
+    Args:
+        beer_stats (pd.DataFrame): statistics of the beers (see get_beer_stats)
+        column (str, optional): column to rank the beers by. Defaults to "nbr_reviews".
+        n (int, optional): number of beers to return. Defaults to 10.
+        min_reviews (int, optional): beers with min_reviews reviews or less are not ranked. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: statistics of the top n beers, sorted by descending value of the column
+    """
+    return beer_stats[beer_stats["nbr_reviews"] > min_reviews].nlargest(n, column)
+
+
+def get_user_stats(
+    reviews_df: pd.DataFrame,
+    score_columns: list = SCORE_COLUMNS,
+    by_site: bool = False,
+) -> pd.DataFrame:
+    """Returns the accumulators (count, sum and sum of squares of each score) of each user
+
+    They are computed in a single grouped pass over the reviews. As they are plain sums,
+    statistics of several chunks of reviews can be combined with update_user_stats.
+
+    Args:
+        reviews_df (pd.DataFrame): dataframe of the reviews (see merge_reviews)
+        score_columns (list, optional): scores to compute the statistics of. Defaults to SCORE_COLUMNS.
+        by_site (bool, optional): if True, users are identified by their website and id, so that
+            the bias of a user is computed separately on each website. Defaults to False.
+
+    Returns:
+        pd.DataFrame: dataframe indexed by "user_id" (or ("site", "user_id")) with the columns
+        "<score>_count", "<score>_sum" and "<score>_sumsq"
+    """
+    keys = ["site", "user_id"] if by_site else ["user_id"]
+    scores = reviews_df[score_columns]
+
+    accumulators = pd.concat(
+        [
+            scores.notna().astype(int).add_suffix("_count"),
+            scores.fillna(0).add_suffix("_sum"),
+            (scores.fillna(0) ** 2).add_suffix("_sumsq"),
+            reviews_df[keys],
+        ],
+        axis=1,
+    )
+    return accumulators.groupby(keys, observed=True).sum()
+
+
+def update_user_stats(
+    user_stats: pd.DataFrame, new_user_stats: pd.DataFrame
+) -> pd.DataFrame:
+    """Combines the statistics of the users computed on two distinct sets of reviews
+
+    Args:
+        user_stats (pd.DataFrame): statistics of the users (see get_user_stats)
+        new_user_stats (pd.DataFrame): statistics of the users on new reviews
+
+    Returns:
+        pd.DataFrame: statistics of the users on both sets of reviews
+    """
+    return user_stats.add(new_user_stats, fill_value=0)
+
+
+def add_user_debiased_scores(
+    reviews_df: pd.DataFrame, user_stats: pd.DataFrame, scale: bool = False
+) -> pd.DataFrame:
+    """Adds the scores corrected for the bias of the user who gave them
+
+    The mean score of the user is replaced by the mean score of all the users, so that
+    users that rate everything high or low (and heavy raters) do not bias the means of the
+    groups they belong to. If scale is True, the scores are instead standardized with the mean
+    and the standard deviation of the user (the scores of users whose scores never vary are NaN).
+
+    Args:
+        reviews_df (pd.DataFrame): dataframe of the reviews
+        user_stats (pd.DataFrame): statistics of the users (see get_user_stats), computed on
+            these reviews or on a larger set of reviews containing them
+        scale (bool, optional): if True, compute z-scores instead of centered scores. Defaults to False.
+
+    Returns:
+        pd.DataFrame: reviews with an additional "<score>_debiased" column for each score of user_stats
+    """
+    keys = list(user_stats.index.names)
+    user_index = (
+        pd.MultiIndex.from_frame(reviews_df[keys])
+        if len(keys) > 1
+        else pd.Index(reviews_df[keys[0]])
+    )
+    review_user_stats = user_stats.reindex(user_index)
+
+    reviews_df = reviews_df.copy()
+    score_columns = [
+        column[: -len("_count")]
+        for column in user_stats.columns
+        if column.endswith("_count")
+    ]
+    for score in score_columns:
+        count = review_user_stats[score + "_count"].to_numpy()
+        user_mean = review_user_stats[score + "_sum"].to_numpy() / count
+        scores = reviews_df[score].to_numpy(dtype=float)
+
+        if scale:
+            user_var = (
+                review_user_stats[score + "_sumsq"].to_numpy() / count - user_mean**2
+            )
+            user_std = np.sqrt(np.clip(user_var, 0, None))
+            user_std[user_std < 1e-12] = np.nan
+            reviews_df[score + "_debiased"] = (scores - user_mean) / user_std
+        else:
+            global_mean = (
+                user_stats[score + "_sum"].sum() / user_stats[score + "_count"].sum()
+            )
+            reviews_df[score + "_debiased"] = scores - user_mean + global_mean
+
+    return reviews_df
+
+
 def get_us_reviews(
     reviews_df: pd.DataFrame,
     climate_classifications: pd.DataFrame,
     states_climate: pd.DataFrame,
     general_style: pd.DataFrame,
     min_reviews_per_beer=10,
+    beer_stats: pd.DataFrame = None,
 ) -> pd.DataFrame:
+    """Returns the reviews of the US users, with their climate and the general style of the beer
+
+    Args:
+        reviews_df (pd.DataFrame): dataframe of the reviews (see merge_reviews)
+        climate_classifications (pd.DataFrame): classification of the climates, indexed by climate
+        states_climate (pd.DataFrame): climate of each state, indexed by state
+        general_style (pd.DataFrame): general style of each style
+        min_reviews_per_beer (int, optional): beers with min_reviews_per_beer reviews or less are dropped. Defaults to 10.
+        beer_stats (pd.DataFrame, optional): statistics of the beers (see get_beer_stats, without
+            group_column) whose "nbr_reviews" are used for the min_reviews_per_beer filter, so that
+            the table used to rank the beers is not computed twice. The filter then counts the
+            reviews the table was computed on: a table computed on all the reviews keeps the beers
+            with more than min_reviews_per_beer reviews worldwide, on both websites. Defaults to None,
+            in which case the reviews of the US users of each beer are counted.
+
+    Raises:
+        ValueError: If beer_stats is not indexed by ("beer_id_ba", "beer_id_rb")
+
+    Returns:
+        pd.DataFrame: reviews of the US users
+    """
+    if beer_stats is not None and list(beer_stats.index.names) != [
+        "beer_id_ba",
+        "beer_id_rb",
+    ]:
+        raise ValueError(
+            "beer_stats should be indexed by (beer_id_ba, beer_id_rb), not "
+            + str(list(beer_stats.index.names))
+        )
+
     us_users_ratings = reviews_df.dropna(subset=["user_location"])
     us_users_ratings = us_users_ratings[
         us_users_ratings["user_location"].str.contains("United States")
@@ -325,9 +634,15 @@ def get_us_reviews(
     us_users_ratings["climate"] = us_users_ratings["user_location"].map(
         states_climate["Climate"]
     )
-    us_users_ratings["nbr_ratings"] = us_users_ratings.groupby("beer_name")[
-        "beer_name"
-    ].transform("count")
+    if beer_stats is None:
+        beer_stats = get_beer_stats(us_users_ratings, score_columns=[])
+    us_users_ratings["nbr_ratings"] = (
+        beer_stats["nbr_reviews"]
+        .reindex(
+            pd.MultiIndex.from_frame(us_users_ratings[["beer_id_ba", "beer_id_rb"]])
+        )
+        .to_numpy()
+    )
     us_users_ratings = us_users_ratings[
         us_users_ratings["nbr_ratings"] > min_reviews_per_beer
     ]
@@ -347,3 +662,112 @@ def get_us_reviews(
     us_users_ratings = pd.merge(us_users_ratings, general_style, on="style", how="left")
     
     return us_users_ratings
+
+
+# Names used in the user locations that differ from the ones of the climate dataset
+COUNTRY_ALIASES = {
+    "England": "United Kingdom",
+    "Scotland": "United Kingdom",
+    "Wales": "United Kingdom",
+    "Northern Ireland": "United Kingdom",
+    "Czech Republic": "Czechia",
+    "Slovak Republic": "Slovakia",
+    "Macedonia": "North Macedonia",
+    "Bahamas": "The Bahamas",
+    "Virgin Islands (U.S.)": "US Virgin Islands",
+    "Virgin Islands (British)": "British Virgin Islands",
+    "Dem Rep of Congo": "Democratic Republic of the Congo",
+    "East Timor": "Timor-Leste",
+    "Fiji Islands": "Fiji",
+    "Micronesia": "Federated States of Micronesia",
+    "Saint Vincent and The Grenadines": "Saint Vincent and the Grenadines",
+}
+
+
+def get_climate_index(
+    climate_countries: pd.DataFrame, states_climate: pd.DataFrame
+) -> dict:
+    """Returns a dictionary mapping a (country, state) pair to its climate
+
+    Country level climates are stored with an empty state. The climate codes
+    of climate_countries are upper case (e.g. "DSB"), they are converted to
+    the usual Köppen notation of states_climate (e.g. "Dsb").
+
+    Args:
+        climate_countries (pd.DataFrame): climate zone and average temperature of each country, indexed by "Country"
+        states_climate (pd.DataFrame): climate of each US state, indexed by "State"
+
+    Returns:
+        dict: (country, state) -> (climate, average temperature of the country)
+    """
+    climate_index = {
+        (country, ""): (zone[0].upper() + zone[1:].lower(), temperature)
+        for country, zone, temperature in zip(
+            climate_countries.index,
+            climate_countries["Climate zone"],
+            climate_countries["Avg °C"],
+        )
+    }
+    us_temperature = climate_index.get(("United States", ""), (None, np.nan))[1]
+    climate_index.update(
+        {
+            ("United States", state): (climate, us_temperature)
+            for state, climate in states_climate["Climate"].items()
+        }
+    )
+    return climate_index
+
+
+def add_user_climate(
+    reviews_df: pd.DataFrame,
+    climate_countries: pd.DataFrame,
+    states_climate: pd.DataFrame,
+    location_column: str = "user_location",
+) -> pd.DataFrame:
+    """Adds the country, state and climate of the users to the reviews, for users all around the world
+
+    Each distinct location (e.g. "United States, California" or "Belgium") is parsed
+    and resolved only once, the results are then broadcast to the reviews through
+    the codes of the factorized location column. US users get the climate of their
+    state, the other users the climate of their country.
+
+    Args:
+        reviews_df (pd.DataFrame): dataframe of the reviews
+        climate_countries (pd.DataFrame): climate zone and average temperature of each country, indexed by "Country"
+        states_climate (pd.DataFrame): climate of each US state, indexed by "State"
+        location_column (str, optional): column containing the location of the user. Defaults to "user_location".
+
+    Returns:
+        pd.DataFrame: reviews with the additional categorical columns "user_country", "user_state"
+        and "climate", and the float column "country_avg_temperature"
+    """
+    climate_index = get_climate_index(climate_countries, states_climate)
+    location_codes, locations = pd.factorize(reviews_df[location_column])
+
+    countries, states, climates, temperatures = [], [], [], []
+    for location in locations:
+        country, _, state = location.partition(", ")
+        country = COUNTRY_ALIASES.get(country, country)
+        climate, temperature = climate_index.get(
+            (country, state), climate_index.get((country, ""), (None, np.nan))
+        )
+        countries.append(country)
+        states.append(state or None)
+        climates.append(climate)
+        temperatures.append(temperature)
+
+    def broadcast(values):
+        # The code -1 of missing locations selects the missing value appended at the end
+        values = pd.Categorical(values)
+        codes = np.append(values.codes, -1)[location_codes]
+        return pd.Categorical.from_codes(codes, values.categories)
+
+    reviews_df = reviews_df.copy()
+    reviews_df["user_country"] = broadcast(countries)
+    reviews_df["user_state"] = broadcast(states)
+    reviews_df["climate"] = broadcast(climates)
+    reviews_df["country_avg_temperature"] = np.append(
+        np.array(temperatures, dtype=float), np.nan
+    )[location_codes]
+
+    return reviews_df
@@ -0,0 +1,200 @@
+"""
+sentiment.py
+
+This file contains functions for scoring the sentiment of the text reviews
+and aggregating the scores per climate and per beer style.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+REVIEW_KEYS = ["beer_id", "user_id", "date"]
+SENTIMENT_COLUMNS = ["polarity", "subjectivity"]
+GROUP_COLUMNS = ["climate", "climate_scheme", "general_style"]
+
+
+def _detect_lang(text: str) -> str:
+    """Returns the language code of the text, or "unknown" if it cannot be detected
+
+    Args:
+        text (str): text of the review
+
+    Returns:
+        str: language code of the text (e.g. "en")
+    """
+    from langdetect import detect
+
+    try:
+        return detect(text)
+    except Exception:
+        return "unknown"
+
+
+def get_english_reviews(
+    reviews_path: str,
+    lang_cache_path: str,
+    group_columns: list = GROUP_COLUMNS,
+) -> pd.DataFrame:
+    """Returns the english text reviews of the US review dataset
+
+    The language of each review is read from the cache written by the text
+    review notebook (`us_users_txt_rev_with_lang.csv`). If the cache does not
+    exist yet, the language is detected and the cache is written so that the
+    detection only ever runs once.
+
+    Args:
+        reviews_path (str): path to the gzipped csv of the US reviews (`us_users_ratings.csv`)
+        lang_cache_path (str): path to the csv caching the language of each review
+        group_columns (list, optional): columns to keep for the aggregations. Defaults to GROUP_COLUMNS.
+
+    Returns:
+        pd.DataFrame: english reviews with the review keys, the text and the group columns
+    """
+    reviews = pd.read_csv(
+        reviews_path,
+        compression="gzip",
+        usecols=REVIEW_KEYS + ["text"] + list(group_columns),
+        dtype={"beer_id": "int32", "user_id": "str", "text": "str"},
+    )
+    reviews = reviews.dropna(subset=["text"])
+
+    if os.path.exists(lang_cache_path):
+        languages = pd.read_csv(
+            lang_cache_path,
+            usecols=REVIEW_KEYS + ["language"],
+            dtype={"beer_id": "int32", "user_id": "str", "language": "category"},
+        ).drop_duplicates(subset=REVIEW_KEYS)
+        reviews = reviews.merge(languages, on=REVIEW_KEYS, how="left")
+    else:
+        reviews["language"] = reviews["text"].map(_detect_lang)
+        reviews[REVIEW_KEYS + ["language"]].to_csv(lang_cache_path, index=False)
+
+    reviews = reviews[reviews["language"] == "en"].drop(columns="language")
+    for column in group_columns:
+        reviews[column] = reviews[column].astype("category")
+
+    return reviews.reset_index(drop=True)
+
+
+def _score_texts(texts: list) -> tuple:
+    """Returns the polarity and subjectivity of each text of a chunk, as float32 numpy arrays"""
+    from textblob import TextBlob
+
+    scores = np.array(
+        [tuple(TextBlob(text).sentiment) for text in texts], dtype=np.float32
+    ).reshape(-1, 2)
+    return scores[:, 0], scores[:, 1]
+
+
+def get_sentiment_scores(texts, batch_size: int = 1000, n_process: int = 1) -> tuple:
+    """Returns the polarity and subjectivity of each text
+
+    The scores are those of `spacytextblob`, which only wraps TextBlob around the raw
+    text of the document and computes them lazily in the process reading the document.
+    The texts are therefore scored directly with TextBlob, in chunks of batch_size texts
+    that are spread over n_process worker processes, and each text is scored only once.
+
+    Args:
+        texts (iterable of str): texts to score
+        batch_size (int, optional): number of texts sent to a worker at once. Defaults to 1000.
+        n_process (int, optional): number of worker processes. Defaults to 1.
+
+    Returns:
+        tuple: (polarity, subjectivity) as float32 numpy arrays
+    """
+    texts = list(texts)
+    chunks = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    if n_process > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_process) as executor:
+            scores = list(executor.map(_score_texts, chunks))
+    else:
+        scores = [_score_texts(chunk) for chunk in chunks]
+
+    if not scores:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    polarity, subjectivity = zip(*scores)
+    return np.concatenate(polarity), np.concatenate(subjectivity)
+
+
+def get_sentiment_df(
+    reviews_df: pd.DataFrame,
+    batch_size: int = 1000,
+    n_process: int = 1,
+    cache_path: str = None,
+) -> pd.DataFrame:
+    """Returns the sentiment scores of the reviews next to the review keys
+
+    The cache is keyed on the review keys: the scores of the reviews found in it are
+    reused, and only the other reviews are scored and appended to it. Any subset or
+    refresh of the reviews can therefore share the same cache.
+
+    Args:
+        reviews_df (pd.DataFrame): reviews with the review keys and a "text" column (see get_english_reviews)
+        batch_size (int, optional): number of texts sent to a worker at once. Defaults to 1000.
+        n_process (int, optional): number of worker processes. Defaults to 1.
+        cache_path (str, optional): if given, the scores are read from / written to this csv file. Defaults to None.
+
+    Returns:
+        pd.DataFrame: reviews without the text, with float32 "polarity" and "subjectivity" columns
+    """
+    sentiment_df = reviews_df.drop(columns="text").reset_index(drop=True)
+    has_cache = cache_path is not None and os.path.exists(cache_path)
+
+    if has_cache:
+        cached = pd.read_csv(
+            cache_path,
+            usecols=REVIEW_KEYS + SENTIMENT_COLUMNS,
+            dtype={
+                "beer_id": "int32",
+                "user_id": "str",
+                "polarity": "float32",
+                "subjectivity": "float32",
+            },
+        ).drop_duplicates(subset=REVIEW_KEYS)
+        sentiment_df = sentiment_df.merge(cached, on=REVIEW_KEYS, how="left")
+    else:
+        for column in SENTIMENT_COLUMNS:
+            sentiment_df[column] = np.float32(np.nan)
+
+    missing = sentiment_df["polarity"].isna().to_numpy()
+    if missing.any():
+        polarity, subjectivity = get_sentiment_scores(
+            reviews_df["text"].to_numpy()[missing],
+            batch_size=batch_size,
+            n_process=n_process,
+        )
+        sentiment_df.loc[missing, "polarity"] = polarity
+        sentiment_df.loc[missing, "subjectivity"] = subjectivity
+
+        if cache_path is not None:
+            sentiment_df.loc[missing, REVIEW_KEYS + SENTIMENT_COLUMNS].to_csv(
+                cache_path, mode="a", header=not has_cache, index=False
+            )
+
+    return sentiment_df
+
+
+def get_sentiment_by_group(
+    sentiment_df: pd.DataFrame, group_columns: list = GROUP_COLUMNS
+) -> dict:
+    """Returns the sentiment statistics aggregated for each grouping column
+
+    Args:
+        sentiment_df (pd.DataFrame): output of get_sentiment_df
+        group_columns (list, optional): columns to group by, one at a time. Defaults to GROUP_COLUMNS.
+
+    Returns:
+        dict: group column -> DataFrame indexed by the group values, with the
+        count, mean and std of the polarity and of the subjectivity
+    """
+    return {
+        column: sentiment_df.groupby(column, observed=True)[SENTIMENT_COLUMNS].agg(
+            ["count", "mean", "std"]
+        )
+        for column in group_columns
+    }
@@ -0,0 +1,185 @@
+"""
+time_index.py
+
+This file contains functions for building a time index on the reviews and querying it.
+
+The reviews are sorted by date once, so that date ranges, months and seasons are contiguous
+slices found by binary search, and the history of each user is a slice of a precomputed
+permutation, instead of masks over the full table.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# reviews: reviews sorted by date (numeric unix time), with the additional columns "year" and "month"
+# first_month: key (year * 12 + month - 1) of the first month of the reviews
+# month_offsets: reviews of the i-th month since first_month are reviews[month_offsets[i]:month_offsets[i + 1]]
+# users: index of the user ids
+# user_order, user_offsets: positions of the reviews of the i-th user sorted by date are
+#   user_order[user_offsets[i]:user_offsets[i + 1]]
+TimeIndex = namedtuple(
+    "TimeIndex",
+    ["reviews", "first_month", "month_offsets", "users", "user_order", "user_offsets"],
+)
+
+
+def _to_epoch(date) -> int:
+    """Returns the unix time in seconds of a date (timestamp, string or unix time)"""
+    if isinstance(date, (int, np.integer, float, np.floating)):
+        return int(date)
+    return int(pd.Timestamp(date).timestamp())
+
+
+def build_time_index(
+    reviews_df: pd.DataFrame, date_column: str = "date", user_column: str = "user_id"
+) -> TimeIndex:
+    """Returns the time index of the reviews
+
+    Args:
+        reviews_df (pd.DataFrame): dataframe of the reviews, with the date as a unix time in seconds
+            (as a number or as a string, as in the review files)
+        date_column (str, optional): column of the date. Defaults to "date".
+        user_column (str, optional): column of the user id. Defaults to "user_id".
+
+    Returns:
+        TimeIndex: time index of the reviews
+    """
+    # The review files store the date as a string: sort and search on the numeric unix time
+    reviews = reviews_df.assign(**{date_column: pd.to_numeric(reviews_df[date_column])})
+    reviews = reviews.sort_values(date_column, kind="stable").reset_index(drop=True)
+    dates = pd.to_datetime(reviews[date_column], unit="s")
+    reviews["year"] = dates.dt.year.astype(np.int16)
+    reviews["month"] = dates.dt.month.astype(np.int8)
+
+    # Reviews are sorted by date, so the month keys are sorted too
+    month_keys = reviews["year"].to_numpy(dtype=np.int64) * 12 + reviews["month"] - 1
+    first_month = int(month_keys.iloc[0]) if len(reviews) else 0
+    n_months = int(month_keys.iloc[-1]) - first_month + 1 if len(reviews) else 0
+    month_offsets = np.searchsorted(
+        month_keys.to_numpy(), np.arange(first_month, first_month + n_months + 1)
+    )
+
+    # Stable sort of the date-sorted reviews by user: histories are sorted by date
+    user_codes, users = pd.factorize(reviews[user_column])
+    user_order = np.argsort(user_codes, kind="stable")
+    user_offsets = np.concatenate(
+        ([0], np.cumsum(np.bincount(user_codes[user_codes >= 0], minlength=len(users))))
+    )
+    user_order = user_order[np.sum(user_codes < 0) :]
+
+    return TimeIndex(
+        reviews, first_month, month_offsets, pd.Index(users), user_order, user_offsets
+    )
+
+
+def get_date_range(
+    time_index: TimeIndex, start=None, end=None, date_column: str = "date"
+) -> pd.DataFrame:
+    """Returns the reviews with start <= date < end
+
+    Args:
+        time_index (TimeIndex): time index of the reviews
+        start (optional): first date (timestamp, string or unix time). Defaults to the first review.
+        end (optional): date after the last date. Defaults to after the last review.
+        date_column (str, optional): column of the date. Defaults to "date".
+
+    Returns:
+        pd.DataFrame: reviews of the date range, sorted by date
+    """
+    dates = time_index.reviews[date_column].to_numpy()
+    first = 0 if start is None else np.searchsorted(dates, _to_epoch(start), "left")
+    last = len(dates) if end is None else np.searchsorted(dates, _to_epoch(end), "left")
+    return time_index.reviews.iloc[first:last]
+
+
+def get_months(time_index: TimeIndex, months: list, years: list = None) -> pd.DataFrame:
+    """Returns the reviews of the given months, e.g. the reviews of a season
+
+    Args:
+        time_index (TimeIndex): time index of the reviews
+        months (list): months (1 to 12) to select, e.g. [6, 7, 8] for the summer
+        years (list, optional): years to select. Defaults to all the years.
+
+    Returns:
+        pd.DataFrame: reviews of the given months, sorted by date
+    """
+    n_months = len(time_index.month_offsets) - 1
+    keys = time_index.first_month + np.arange(n_months)
+    selected = np.isin(keys % 12 + 1, months)
+    if years is not None:
+        selected &= np.isin(keys // 12, years)
+
+    starts = time_index.month_offsets[:-1][selected]
+    ends = time_index.month_offsets[1:][selected]
+    positions = np.concatenate(
+        [np.arange(start, end) for start, end in zip(starts, ends)] or [[]]
+    ).astype(int)
+    return time_index.reviews.iloc[positions]
+
+
+def get_user_history(time_index: TimeIndex, user_id) -> pd.DataFrame:
+    """Returns the reviews of the user, sorted by date
+
+    Args:
+        time_index (TimeIndex): time index of the reviews
+        user_id: id of the user
+
+    Returns:
+        pd.DataFrame: reviews of the user, sorted by date
+    """
+    code = time_index.users.get_loc(user_id)
+    start, end = time_index.user_offsets[code], time_index.user_offsets[code + 1]
+    return time_index.reviews.iloc[time_index.user_order[start:end]]
+
+
+def get_rolling_trend(
+    time_index: TimeIndex,
+    value_column: str,
+    group_column: str = "climate",
+    window: int = 12,
+) -> pd.DataFrame:
+    """Returns the rolling mean of the value over the last `window` months for each group
+
+    Args:
+        time_index (TimeIndex): time index of the reviews
+        value_column (str): column of which the mean is computed (e.g. "overall")
+        group_column (str, optional): column defining the groups. Defaults to "climate".
+        window (int, optional): number of months of the rolling window. Defaults to 12.
+
+    Returns:
+        pd.DataFrame: dataframe indexed by month (pd.Period), with one column per group
+    """
+    reviews = time_index.reviews
+    n_months = len(time_index.month_offsets) - 1
+    month = np.repeat(np.arange(n_months), np.diff(time_index.month_offsets))
+    group_codes, groups = pd.factorize(reviews[group_column])
+    values = reviews[value_column].to_numpy(dtype=float)
+
+    # Sums and counts of the values of each (month, group), in one pass
+    valid = (group_codes >= 0) & ~np.isnan(values)
+    cell = month[valid] * len(groups) + group_codes[valid]
+    shape = (n_months, len(groups))
+    sums = np.bincount(cell, values[valid], n_months * len(groups)).reshape(shape)
+    counts = np.bincount(cell, minlength=n_months * len(groups)).reshape(shape)
+
+    # Rolling sums as differences of cumulative sums
+    def rolling(x):
+        cumulative = np.cumsum(np.vstack([np.zeros((1, x.shape[1])), x]), axis=0)
+        return (
+            cumulative[window:] - cumulative[:-window] if n_months >= window else x[:0]
+        )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        trend = rolling(sums) / rolling(counts)
+
+    first = time_index.first_month + window - 1
+    index = pd.PeriodIndex(
+        [
+            pd.Period(year=k // 12, month=k % 12 + 1, freq="M")
+            for k in range(first, first + len(trend))
+        ],
+        name="month",
+    )
+    return pd.DataFrame(trend, index=index, columns=pd.Index(groups, name=group_column))